@@ -7,10 +7,14 @@
 from typing import Final, Optional, Sequence, Tuple, final
 
 from torch import Tensor
-from torch.nn import GLU, Conv1d, Sequential
+from torch.nn import Module
+from torch.nn.functional import glu
 
 from fairseq2.models.feature_extractor import SequenceFeatureExtractor
+from fairseq2.nn.conv import ChannelsLastConv1d
+from fairseq2.nn.module_list import ModuleList
 from fairseq2.nn.padding import PaddingMask
+from fairseq2.nn.utils.compile import SeqLenSpecializedFunction
 from fairseq2.typing import DataType, Device, finaloverride
 
 
@@ -22,9 +26,11 @@ class Conv1dFbankSubsampler(SequenceFeatureExtractor):
     """
 
     # All convolutions use the same stride.
-    stride: Final[int] = 2
+    stride: Final[int]
 
-    layers: Sequential
+    layers: ModuleList
+    compiled_layers: SeqLenSpecializedFunction
+    _seq_len_divisor: Final[int]
 
     def __init__(
         self,
@@ -33,6 +39,7 @@ class Conv1dFbankSubsampler(SequenceFeatureExtractor):
         feature_dim: int,
         *,
         kernel_sizes: Optional[Sequence[int]] = None,
+        stride: int = 2,
         device: Optional[Device] = None,
         dtype: Optional[DataType] = None,
     ) -> None:
@@ -45,19 +52,31 @@ class Conv1dFbankSubsampler(SequenceFeatureExtractor):
             The dimensionality of extracted features.
         :param kernel_sizes:
             The kernel size of each 1D convolution.
+        :param stride:
+            The stride of each 1D convolution. A single convolution with a
+            larger stride (e.g. ``kernel_sizes=[5], stride=4``) subsamples as
+            much as a deeper stack, at the cost of one convolution and gated
+            linear unit instead of several. Note that such a configuration is
+            not interchangeable with the default one; it has to be trained as
+            such.
         """
         super().__init__(feature_dim)
 
         if kernel_sizes is None:
             kernel_sizes = [3, 3]
 
-        self.layers = Sequential()
+        if stride < 1:
+            raise ValueError(
+                f"`stride` must be greater than or equal to 1, but is {stride} instead."
+            )
+
+        self.stride = stride
+
+        self.layers = ModuleList()
 
         last_layer = len(kernel_sizes) - 1
 
         for i, kernel_size in enumerate(kernel_sizes):
-            layer = Sequential()
-
             if i == 0:
                 layer_input_dim = num_channels
             else:
@@ -68,21 +87,27 @@ class Conv1dFbankSubsampler(SequenceFeatureExtractor):
             else:
                 layer_output_dim = inner_dim
 
-            conv = Conv1d(
+            layer = Conv1dFbankSubsamplerLayer(
                 layer_input_dim,
                 layer_output_dim,
                 kernel_size,
-                stride=self.stride,
-                padding=kernel_size // 2,
+                self.stride,
                 device=device,
                 dtype=dtype,
             )
 
-            layer.add_module("conv", conv)
-            layer.add_module("activation", GLU(dim=1))
-
             self.layers.append(layer)
 
+        # Each layer contracts the temporal dimension by `stride`; precompute
+        # the overall factor used in `_contract_seq_lens`.
+        self._seq_len_divisor = self.stride ** len(kernel_sizes)
+
+        self.compiled_layers = SeqLenSpecializedFunction(self._run_layers, seq_dim=2)
+
+    def compile_for_shape(self, num_frames: int) -> None:
+        """Compile the convolutions for inputs with ``num_frames`` frames."""
+        self.compiled_layers.add_seq_len(num_frames)
+
     @finaloverride
     def forward(
         self, seqs: Tensor, padding_mask: Optional[PaddingMask]
@@ -95,12 +120,13 @@ class Conv1dFbankSubsampler(SequenceFeatureExtractor):
             :math:`C` is the number of channels.
         """
         # Apply the convolution along the temporal dimension (i.e. along the
-        # sequence).
+        # sequence). The layers keep `seqs` in this channels-last layout, so
+        # neither transpose gets materialized.
         # (N, S, C) -> (N, C, S)
         seqs = seqs.transpose(1, 2)
 
         # (N, C, S) -> (N, F, S_out)
-        features = self.layers(seqs)
+        features = self.compiled_layers(seqs)
 
         # (N, F, S_out) -> (N, S_out, F)
         features = features.transpose(1, 2)
@@ -114,10 +140,65 @@ class Conv1dFbankSubsampler(SequenceFeatureExtractor):
 
         return features, padding_mask
 
+    def _run_layers(self, seqs: Tensor) -> Tensor:
+        for layer in self.layers:
+            seqs = layer(seqs)
+
+        return seqs
+
     def _contract_seq_lens(self, num_frames: Tensor) -> Tensor:
-        seq_lens = num_frames.clone()
+        # Each layer maps a length `x` to `floor((x - 1) / stride) + 1`. Since
+        # nested floor divisions compose, `n` layers contract `x` in a single
+        # step to `floor((x - 1) / stride^n) + 1`.
+        return ((num_frames - 1) // self._seq_len_divisor) + 1
+
 
-        for _ in range(len(self.layers)):
-            seq_lens = (((seq_lens - 1) / self.stride) + 1.0).floor()
+class Conv1dFbankSubsamplerLayer(Module):
+    """Represents a layer used in :class:`Conv1dFbankSubsampler`.
 
-        return seq_lens.type_as(num_frames)
+    The layer is compatible with TorchScript.
+    """
+
+    conv: ChannelsLastConv1d
+
+    def __init__(
+        self,
+        input_dim: int,
+        output_dim: int,
+        kernel_size: int,
+        stride: int,
+        *,
+        device: Optional[Device] = None,
+        dtype: Optional[DataType] = None,
+    ) -> None:
+        """
+        :param input_dim:
+            The number of input channels.
+        :param output_dim:
+            The number of output channels of the 1D convolution. The layer
+            outputs half as many channels after the gated linear unit.
+        :param kernel_size:
+            The kernel size of the 1D convolution.
+        :param stride:
+            The stride of the 1D convolution.
+        """
+        super().__init__()
+
+        self.conv = ChannelsLastConv1d(
+            input_dim,
+            output_dim,
+            kernel_size,
+            stride=stride,
+            padding=kernel_size // 2,
+            device=device,
+            dtype=dtype,
+        )
+
+    def forward(self, seqs: Tensor) -> Tensor:
+        # (N, C, S) -> (N, 2F, S_out)
+        seqs = self.conv(seqs)
+
+        # `glu` is a single fused kernel that reads the 2F-channel convolution
+        # output once and writes the F-channel result.
+        # (N, 2F, S_out) -> (N, F, S_out)
+        return glu(seqs, dim=1)
@@ -4,17 +4,19 @@
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree.
 
-from typing import Optional, final
+from typing import Any, Optional, Tuple, Union, final
 
+import torch
 import torch.nn as nn
 from torch import Tensor
-from torch.nn import GELU, Conv1d, Module, Sequential
-from torch.nn.utils.weight_norm import remove_weight_norm, weight_norm
+from torch.nn import GELU, Module, Sequential
+from torch.nn.parameter import Parameter
 
+from fairseq2.nn.conv import ChannelsLastConv1d
 from fairseq2.nn.incremental_state import IncrementalStateBag
-from fairseq2.nn.normalization import LayerNorm, StandardLayerNorm
 from fairseq2.nn.padding import PaddingMask, apply_padding_mask
 from fairseq2.nn.position_encoder import PositionEncoder
+from fairseq2.nn.utils.compile import SeqLenSpecializedFunction
 from fairseq2.typing import DataType, Device, finaloverride, override
 
 
@@ -23,9 +25,10 @@ class Wav2Vec2PositionEncoder(PositionEncoder):
     """Encodes sequences with relative positional information as described in
     Section 2 of :cite:t:`https://doi.org/10.48550/arxiv.2006.11477`."""
 
-    conv: Conv1d
+    conv: "Wav2Vec2PositionalConv1d"
     remove_pad: bool
     activation: GELU
+    compiled_encode: SeqLenSpecializedFunction
 
     def __init__(
         self,
@@ -60,6 +63,8 @@ class Wav2Vec2PositionEncoder(PositionEncoder):
 
         self.activation = GELU()
 
+        self.compiled_encode = SeqLenSpecializedFunction(self._encode, seq_dim=1)
+
     @finaloverride
     def _do_forward(
         self,
@@ -77,11 +82,26 @@ class Wav2Vec2PositionEncoder(PositionEncoder):
         # zero; otherwise, noise will leak into the feature maps.
         seqs = apply_padding_mask(seqs, padding_mask)
 
+        if self.compiled_encode.is_compiled_for(seqs):
+            # The weight is resolved outside of the compiled function since its
+            # caching logic cannot be compiled.
+            encodings = self.compiled_encode(seqs, self.conv.get_weight())
+        else:
+            encodings = self._encode(seqs)
+
+        return _add_encodings(seqs, encodings, padding_mask is not None)
+
+    def _encode(self, seqs: Tensor, weight: Optional[Tensor] = None) -> Tensor:
         # (N, S, E) -> (N, E, S)
         encodings = seqs.transpose(1, 2)
 
+        # The convolution keeps `encodings` in this channels-last layout, so
+        # neither transpose gets materialized.
         # (N, E, S) -> (N, E, S)
-        encodings = self.conv(encodings)
+        if weight is None:
+            encodings = self.conv(encodings)
+        else:
+            encodings = self.conv.conv_forward(encodings, weight)
 
         if self.remove_pad:
             encodings = encodings[:, :, :-1]
@@ -89,34 +109,222 @@ class Wav2Vec2PositionEncoder(PositionEncoder):
         encodings = self.activation(encodings)
 
         # (N, E, S) -> (N, S, E)
-        encodings = encodings.transpose(1, 2)
+        return encodings.transpose(1, 2)
+
+    def compile_for_shape(self, seq_len: int) -> None:
+        """Compile the encoder for inputs of length ``seq_len``."""
+        self.compiled_encode.add_seq_len(seq_len)
+
+
+def _add_encodings(seqs: Tensor, encodings: Tensor, owns_seqs: bool) -> Tensor:
+    # `encodings` is always an intermediate of the position encoder, and so is
+    # `seqs` if it was masked. We accumulate into one of them instead of
+    # allocating a new tensor, but only if the result keeps the same data type
+    # and stays contiguous. Note that `gelu` does not need its output for the
+    # backward pass. `seqs`, on the other hand, is also the input of the
+    # convolution, which saves it for the backward pass; we can only modify it
+    # if autograd is disabled.
+    if encodings.dtype == seqs.dtype:
+        if encodings.is_contiguous():
+            return encodings.add_(seqs)
+
+        if owns_seqs and seqs.is_contiguous() and not torch.is_grad_enabled():
+            return seqs.add_(encodings)
+
+    return seqs + encodings
+
+
+class Wav2Vec2PositionalConv1d(ChannelsLastConv1d):
+    """Represents the convolution used in :class:`Wav2Vec2PositionEncoder`.
+
+    The weight of the convolution is reparameterized with weight normalization
+    along its last dimension. The normalization is always computed in single
+    precision, even if the module is in half precision. As long as autograd
+    does not track the reparameterization parameters (e.g. in inference or if
+    they are frozen), the normalized weight is computed once and reused across
+    calls. If only the direction ``weight_v`` is frozen, its norm is reused.
+    """
+
+    weight_g: Parameter
+    weight_v: Parameter
+    cached_weight: Optional[Tensor]
+    cached_v_norm: Optional[Tensor]
+    cached_weight_versions: Tuple[int, int]
+    cached_v_norm_version: int
+
+    def __init__(
+        self,
+        in_channels: int,
+        out_channels: int,
+        kernel_size: int,
+        *,
+        stride: int = 1,
+        padding: Union[str, int] = 0,
+        dilation: int = 1,
+        groups: int = 1,
+        bias: bool = True,
+        padding_mode: str = "zeros",
+        device: Optional[Device] = None,
+        dtype: Optional[DataType] = None,
+    ) -> None:
+        """See :class:`torch.nn.Conv1d` for the parameters."""
+        super().__init__(
+            in_channels,
+            out_channels,
+            kernel_size,
+            stride=stride,
+            padding=padding,
+            dilation=dilation,
+            groups=groups,
+            bias=bias,
+            padding_mode=padding_mode,
+            device=device,
+            dtype=dtype,
+        )
 
-        return seqs + encodings
+        # Replace the plain weight with its weight normalization decomposition.
+        delattr(self, "weight")
 
+        # Register in the same order as `torch.nn.utils.weight_norm` so that the
+        # parameter order (e.g. of optimizer states) is unchanged.
+        self.weight_g = Parameter(
+            torch.empty((1, 1, kernel_size), device=device, dtype=dtype)
+        )
+
+        self.weight_v = Parameter(
+            torch.empty(
+                (out_channels, in_channels // groups, kernel_size),
+                device=device,
+                dtype=dtype,
+            )
+        )
 
-class Wav2Vec2PositionalConv1d(Conv1d):
-    """Represents the convolution used in :class:`Wav2Vec2PositionEncoder`."""
+        self.reset_parameters()
 
     @override
     def reset_parameters(self) -> None:
-        model_dim, kernel_size = self.in_channels, self.kernel_size[0]
+        # `Conv1d.__init__` calls this method before we replace its weight.
+        if not hasattr(self, "weight_v"):
+            return
 
-        try:
-            remove_weight_norm(self)
-        except ValueError:
-            # Raised during the `__init__` call since we don't have the weight
-            # norm hook registered yet. Safe to ignore.
-            pass
+        model_dim, kernel_size = self.in_channels, self.kernel_size[0]
 
         nn.init.normal_(
-            self.weight, mean=0.0, std=(4.0 / (kernel_size * model_dim)) ** 0.5
+            self.weight_v, mean=0.0, std=(4.0 / (kernel_size * model_dim)) ** 0.5
         )
 
-        weight_norm(self, dim=2)
+        with torch.no_grad():
+            self.weight_g.copy_(torch.norm_except_dim(self.weight_v, 2, dim=2))
 
         if self.bias is not None:
             nn.init.constant_(self.bias, 0.0)
 
+        self._clear_cache()
+
+    @property
+    def weight(self) -> Tensor:  # type: ignore[override]
+        """The weight-normalized convolution weight. See :meth:`get_weight`."""
+        return self.get_weight()
+
+    @override
+    def forward(self, seqs: Tensor) -> Tensor:
+        return self.conv_forward(seqs, self.get_weight())
+
+    def get_weight(self) -> Tensor:
+        """Return the weight-normalized convolution weight."""
+        grad_enabled = torch.is_grad_enabled()
+
+        self._invalidate_stale_cache()
+
+        # `v` is tracked by autograd; nothing can be reused.
+        if grad_enabled and self.weight_v.requires_grad:
+            self._clear_cache()
+
+            return self._compute_weight()
+
+        # `v` is frozen, but `g` is tracked by autograd; reuse the norm of `v`.
+        if grad_enabled and self.weight_g.requires_grad:
+            self.cached_weight = None
+
+            v = self.weight_v.float()
+
+            if self.cached_v_norm is None:
+                self.cached_v_norm = torch.norm_except_dim(v, 2, dim=2)
+
+                self.cached_v_norm_version = self.weight_v._version
+
+            weight = v * (self.weight_g.float() / self.cached_v_norm)
+
+            return weight.type_as(self.weight_v)
+
+        if self.cached_weight is None:
+            self.cached_weight = self._compute_weight()
+
+            self.cached_weight_versions = (
+                self.weight_v._version,
+                self.weight_g._version,
+            )
+
+        return self.cached_weight
+
+    def _compute_weight(self) -> Tensor:
+        # For numerical stability, normalize in single precision; this lets the
+        # convolution itself run in half precision.
+        weight = torch._weight_norm(self.weight_v.float(), self.weight_g.float(), dim=2)
+
+        return weight.type_as(self.weight_v)
+
+    def _invalidate_stale_cache(self) -> None:
+        # The parameters might have been modified in-place, moved, or cast since
+        # we last cached. The norm of `v` only depends on `v`; in particular, it
+        # stays valid while an optimizer updates `g`.
+        versions = (self.weight_v._version, self.weight_g._version)
+
+        weight = self.cached_weight
+
+        if weight is not None:
+            if (
+                self.cached_weight_versions != versions
+                or weight.dtype != self.weight_v.dtype
+                or not self._is_usable(weight)
+            ):
+                self.cached_weight = None
+
+        v_norm = self.cached_v_norm
+
+        if v_norm is not None:
+            if self.cached_v_norm_version != versions[0] or not self._is_usable(v_norm):
+                self.cached_v_norm = None
+
+    def _is_usable(self, cached: Tensor) -> bool:
+        if cached.device != self.weight_v.device:
+            return False
+
+        # Tensors created in inference mode cannot be used by autograd.
+        if cached.is_inference() and not torch.is_inference_mode_enabled():
+            return False
+
+        return True
+
+    def _clear_cache(self) -> None:
+        self.cached_weight = None
+        self.cached_v_norm = None
+
+        self.cached_weight_versions = (-1, -1)
+        self.cached_v_norm_version = -1
+
+    @override
+    def train(self, mode: bool = True) -> "Wav2Vec2PositionalConv1d":
+        self._clear_cache()
+
+        return super().train(mode)
+
+    @override
+    def _load_from_state_dict(self, *args: Any, **kwargs: Any) -> None:
+        self._clear_cache()
+
+        super()._load_from_state_dict(*args, **kwargs)
+
 
 @final
 class Wav2Vec2StackedPositionEncoder(PositionEncoder):
@@ -129,6 +337,7 @@ class Wav2Vec2StackedPositionEncoder(PositionEncoder):
     """
 
     layers: Sequential
+    compiled_encode: SeqLenSpecializedFunction
 
     def __init__(
         self,
@@ -168,6 +377,8 @@ class Wav2Vec2StackedPositionEncoder(PositionEncoder):
 
             self.layers.append(layer)
 
+        self.compiled_encode = SeqLenSpecializedFunction(self._encode, seq_dim=1)
+
     @finaloverride
     def _do_forward(
         self,
@@ -185,23 +396,33 @@ class Wav2Vec2StackedPositionEncoder(PositionEncoder):
         # zero; otherwise, noise will leak into the feature maps.
         seqs = apply_padding_mask(seqs, padding_mask)
 
+        encodings = self.compiled_encode(seqs)
+
+        return _add_encodings(seqs, encodings, padding_mask is not None)
+
+    def _encode(self, seqs: Tensor) -> Tensor:
         # (N, S, E) -> (N, E, S)
         encodings = seqs.transpose(1, 2)
 
+        # The layers keep `encodings` in this channels-last layout, so neither
+        # transpose gets materialized.
         # (N, E, S) -> (N, E, S)
         encodings = self.layers(encodings)
 
         # (N, E, S) -> (N, S, E)
-        encodings = encodings.transpose(1, 2)
+        return encodings.transpose(1, 2)
 
-        return seqs + encodings
+    def compile_for_shape(self, seq_len: int) -> None:
+        """Compile the encoder for inputs of length ``seq_len``."""
+        self.compiled_encode.add_seq_len(seq_len)
 
 
 class Wav2Vec2PositionEncoderLayer(Module):
     """Represents a layer used in :class:`Wav2Vec2StackedPositionEncoder`."""
 
-    conv: Conv1d
-    layer_norm: LayerNorm
+    conv: ChannelsLastConv1d
+    remove_pad: bool
+    eps: float
     activation: GELU
 
     def __init__(
@@ -215,34 +436,45 @@ class Wav2Vec2PositionEncoderLayer(Module):
     ) -> None:
         super().__init__()
 
-        self.conv = Conv1d(
+        self.conv = ChannelsLastConv1d(
             model_dim,
             model_dim,
             kernel_size,
-            padding="same",
+            padding=kernel_size // 2,
             groups=num_groups,
             device=device,
             dtype=dtype,
         )
 
-        self.layer_norm = StandardLayerNorm(
-            model_dim, bias=True, elementwise_affine=False, device=device, dtype=dtype
-        )
+        # Rather than having PyTorch compute the "same" padding at every call,
+        # and pad the input if it is asymmetric (i.e. for even kernel sizes),
+        # we pad symmetrically and trim the extra leading output element.
+        self.remove_pad = kernel_size % 2 == 0
+
+        # The layer norm has no affine transformation; we normalize along the
+        # channel dimension directly in `forward`.
+        self.eps = 1e-5
 
         self.activation = GELU()
 
     def forward(self, encodings: Tensor) -> Tensor:
+        # The convolution keeps `encodings` in the channels-last layout.
         # (N, E, S) -> (N, E, S)
         encodings = self.conv(encodings)
 
-        # (N, E, S) -> (N, S, E)
-        encodings = encodings.transpose(1, 2)
-
-        encodings = self.layer_norm(encodings)
+        if self.remove_pad:
+            encodings = encodings[:, :, 1:]
 
-        # (N, S, E) -> (N, E, S)
-        encodings = encodings.transpose(1, 2)
+        # For numerical stability normalize in single precision.
+        encodings = self._norm(encodings.float()).type_as(encodings)
 
         encodings = self.activation(encodings)
 
         return encodings
+
+    def _norm(self, x: Tensor) -> Tensor:
+        # Equivalent to a non-affine layer norm over the transposed (N, S, E)
+        # tensor, but avoids materializing the transposes around it.
+        var, mean = torch.var_mean(x, dim=1, unbiased=False, keepdim=True)
+
+        return (x - mean) * torch.rsqrt(var + self.eps)
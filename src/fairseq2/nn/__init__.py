@@ -4,6 +4,7 @@
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree.
 
+from fairseq2.nn.conv import ChannelsLastConv1d as ChannelsLastConv1d
 from fairseq2.nn.embedding import Embedding as Embedding
 from fairseq2.nn.embedding import StandardEmbedding as StandardEmbedding
 from fairseq2.nn.embedding import init_scaled_embedding as init_scaled_embedding
@@ -0,0 +1,79 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+from torch import Tensor
+from torch.nn import Conv1d
+from torch.nn.functional import conv2d
+
+from fairseq2.typing import override
+
+
+class ChannelsLastConv1d(Conv1d):
+    """Applies a 1D convolution over an input without changing its memory
+    layout.
+
+    PyTorch makes permuted inputs of 1D convolutions contiguous. This module
+    runs the convolution as a 2D one instead so that a channels-last input
+    (i.e. a transposed :math:`(N,S,C)` tensor) is consumed as is, and the
+    output retains the same layout.
+
+    .. note::
+        This class has the same parameters and state dict as
+        :class:`torch.nn.Conv1d`.
+    """
+
+    @override
+    def forward(self, seqs: Tensor) -> Tensor:
+        """
+        :param seqs:
+            The input to convolve. *Shape:* :math:`(N,C_{inp},S)`, where
+            :math:`N` is the batch size, :math:`C_{inp}` is the number of input
+            channels, and :math:`S` is the sequence length.
+
+        :returns:
+            The convolved output. *Shape:* :math:`(N,C_{out},S_{out})`, where
+            :math:`C_{out}` is the number of output channels and
+            :math:`S_{out}` is the output sequence length.
+        """
+        return self.conv_forward(seqs, self.weight)
+
+    def conv_forward(self, seqs: Tensor, weight: Tensor) -> Tensor:
+        """Apply the convolution to ``seqs`` using ``weight``.
+
+        :param seqs:
+            The input to convolve. *Shape:* Same as :meth:`forward`.
+        :param weight:
+            The convolution weight. *Shape:* Same as :attr:`weight`.
+        """
+        if self.padding_mode != "zeros":
+            # Non-zero padding modes pad the input explicitly anyway.
+            return self._conv_forward(seqs, weight, self.bias)
+
+        stride, dilation = (1, self.stride[0]), (1, self.dilation[0])
+
+        # (N, C, S) -> (N, C, 1, S)
+        seqs = seqs.unsqueeze(2)
+
+        weight = weight.unsqueeze(2)
+
+        # (N, C, 1, S) -> (N, C_out, 1, S_out)
+        if isinstance(self.padding, str):
+            seqs = conv2d(
+                seqs, weight, self.bias, stride, self.padding, dilation, self.groups
+            )
+        else:
+            seqs = conv2d(
+                seqs,
+                weight,
+                self.bias,
+                stride,
+                (0, self.padding[0]),
+                dilation,
+                self.groups,
+            )
+
+        # (N, C_out, 1, S_out) -> (N, C_out, S_out)
+        return seqs.squeeze(2)
@@ -0,0 +1,97 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+from copy import deepcopy
+from typing import Any, Callable, Dict, Optional, Set, final
+
+import torch
+from torch import Tensor
+
+from fairseq2.utils.version import is_pt2_or_greater
+
+
+@final
+class SeqLenSpecializedFunction:
+    """Calls a static-shape :func:`torch.compile` specialization of a function
+    if the sequence length of its input is one of the registered lengths;
+    otherwise, calls the function eagerly.
+
+    This is meant for inference workloads where inputs come in a few fixed
+    lengths (e.g. streaming chunks). Note that, although dispatching is based
+    on the sequence length only, the compiled function is specialized on the
+    full shape of its inputs, including the batch size. Each distinct shape
+    triggers a recompilation until ``torch._dynamo.config.cache_size_limit``
+    is reached, after which inputs of new shapes run eagerly. Therefore, the
+    other dimensions of the inputs should be fixed as well.
+
+    The function is only compiled once the first length is registered; until
+    then, it always runs eagerly. This lets modules hold an instance even on
+    PyTorch versions that do not support :func:`torch.compile`.
+
+    If ``fn`` is a bound method of a module, a deep copy of the module gets a
+    specialization bound to the copy with the same registered lengths.
+    """
+
+    fn: Callable[..., Tensor]
+    compiled_fn: Optional[Callable[..., Tensor]]
+    seq_dim: int
+    seq_lens: Set[int]
+
+    def __init__(self, fn: Callable[..., Tensor], seq_dim: int) -> None:
+        """
+        :param fn:
+            The function to specialize. Its first argument must be the tensor
+            whose sequence length is used for dispatching.
+        :param seq_dim:
+            The sequence dimension of the first argument of ``fn``.
+        """
+        self.fn = fn
+
+        self.compiled_fn = None
+
+        self.seq_dim = seq_dim
+
+        self.seq_lens = set()
+
+    def add_seq_len(self, seq_len: int) -> None:
+        """Register ``seq_len`` for dispatching to the compiled function.
+
+        Requires PyTorch 2.0 or greater.
+        """
+        if seq_len < 1:
+            raise ValueError(
+                f"`seq_len` must be greater than or equal to 1, but is {seq_len} instead."
+            )
+
+        if self.compiled_fn is None:
+            if not is_pt2_or_greater():
+                raise RuntimeError("`torch.compile` requires PyTorch 2.0 or greater.")
+
+            self.compiled_fn = torch.compile(self.fn, dynamic=False, fullgraph=True)
+
+        self.seq_lens.add(seq_len)
+
+    def is_compiled_for(self, x: Tensor) -> bool:
+        """Return ``True`` if ``x`` is dispatched to the compiled function."""
+        return x.size(self.seq_dim) in self.seq_lens
+
+    def __call__(self, x: Tensor, *args: Any) -> Tensor:
+        if self.compiled_fn is not None and self.is_compiled_for(x):
+            return self.compiled_fn(x, *args)
+
+        return self.fn(x, *args)
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "SeqLenSpecializedFunction":
+        # The compiled function closes over `fn`, and therefore over the object
+        # `fn` might be bound to. Instead of sharing it, we compile the deep
+        # copy of `fn`; for a bound method, `deepcopy` binds it to the copy of
+        # its object.
+        fn_copy = SeqLenSpecializedFunction(deepcopy(self.fn, memo), self.seq_dim)
+
+        for seq_len in self.seq_lens:
+            fn_copy.add_seq_len(seq_len)
+
+        return fn_copy
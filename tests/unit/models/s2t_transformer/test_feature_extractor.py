@@ -0,0 +1,133 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+from copy import deepcopy
+
+import pytest
+import torch
+from torch.nn.functional import conv1d, glu
+
+from fairseq2.models.s2t_transformer import Conv1dFbankSubsampler
+from fairseq2.nn.padding import PaddingMask
+from fairseq2.utils.version import is_pt2_or_greater
+from tests.common import assert_close, assert_equal, device
+
+
+class TestConv1dFbankSubsampler:
+    def test_forward_matches_reference(self) -> None:
+        m = Conv1dFbankSubsampler(8, 16, 12, device=device)
+
+        seqs = torch.randn((4, 21, 8), device=device)
+
+        seq_lens = torch.tensor([21, 15, 9, 1], device=device)
+
+        padding_mask = PaddingMask(seq_lens, batch_seq_len=21)
+
+        features, features_padding_mask = m(seqs, padding_mask)
+
+        # The baseline implementation on a contiguous channels-first input.
+        expected = seqs.transpose(1, 2).contiguous()
+
+        for layer in m.layers:
+            expected = glu(
+                conv1d(
+                    expected,
+                    layer.conv.weight,
+                    layer.conv.bias,
+                    stride=layer.conv.stride,
+                    padding=layer.conv.padding,
+                ),
+                dim=1,
+            )
+
+        assert features.shape == (4, 6, 12)
+
+        assert_close(features, expected.transpose(1, 2))
+
+        assert features_padding_mask is not None
+
+        assert features_padding_mask.batch_seq_len == 6
+
+        assert_equal(features_padding_mask.seq_lens, [6, 4, 3, 1])
+
+    def test_forward_contracts_seq_lens_as_convolutions(self) -> None:
+        m = Conv1dFbankSubsampler(8, 16, 12, kernel_sizes=[3, 3, 3], device=device)
+
+        seq_lens = torch.arange(1, 41, device=device)
+
+        seqs = torch.randn((40, 40, 8), device=device)
+
+        padding_mask = PaddingMask(seq_lens, batch_seq_len=40)
+
+        _, padding_mask = m(seqs, padding_mask)
+
+        assert padding_mask is not None
+
+        expected_seq_lens = seq_lens
+
+        for _ in range(3):
+            expected_seq_lens = (expected_seq_lens + 1) // 2
+
+        assert_equal(padding_mask.seq_lens, expected_seq_lens)
+
+    def test_layers_can_be_scripted(self) -> None:
+        m = Conv1dFbankSubsampler(8, 16, 12, device=device)
+
+        seqs = torch.randn((2, 8, 21), device=device)
+
+        for layer in m.layers:
+            scripted_layer = torch.jit.script(layer)
+
+            assert_close(scripted_layer(seqs), layer(seqs))
+
+            seqs = layer(seqs)
+
+    def test_forward_works_with_single_strided_layer(self) -> None:
+        m = Conv1dFbankSubsampler(8, 16, 12, kernel_sizes=[5], stride=4, device=device)
+
+        seqs = torch.randn((4, 21, 8), device=device)
+
+        seq_lens = torch.tensor([21, 15, 9, 1], device=device)
+
+        padding_mask = PaddingMask(seq_lens, batch_seq_len=21)
+
+        features, padding_mask = m(seqs, padding_mask)
+
+        assert features.shape == (4, 6, 12)
+
+        assert padding_mask is not None
+
+        assert_equal(padding_mask.seq_lens, [6, 4, 3, 1])
+
+    @pytest.mark.skipif(
+        not is_pt2_or_greater(), reason="requires PyTorch 2.0.0 or greater"
+    )
+    def test_compile_for_shape_works(self) -> None:
+        m = Conv1dFbankSubsampler(8, 16, 12, device=device)
+
+        seqs = torch.randn((2, 21, 8), device=device)
+
+        expected, _ = m(seqs, None)
+
+        m.compile_for_shape(21)
+
+        with torch.no_grad():
+            features, _ = m(seqs, None)
+
+        assert_close(features, expected.detach())
+
+        # A deep copy must run its own parameters.
+        m_copy = deepcopy(m)
+
+        with torch.no_grad():
+            for param in m_copy.parameters():
+                param.mul_(2.0)
+
+            expected_copy = m_copy._run_layers(seqs.transpose(1, 2)).transpose(1, 2)
+
+            features_copy, _ = m_copy(seqs, None)
+
+        assert_close(features_copy, expected_copy)
@@ -0,0 +1,429 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+from copy import deepcopy
+from typing import List, Optional, Union
+
+import pytest
+import torch
+from torch import Tensor
+from torch.nn import Conv1d
+from torch.nn.functional import conv1d, gelu, layer_norm
+from torch.nn.utils.weight_norm import weight_norm
+
+from fairseq2.models.wav2vec2 import (
+    Wav2Vec2PositionEncoder,
+    Wav2Vec2StackedPositionEncoder,
+)
+from fairseq2.models.wav2vec2.position_encoder import Wav2Vec2PositionalConv1d
+from fairseq2.nn.padding import PaddingMask, to_padding_mask
+from fairseq2.utils.version import is_pt2_or_greater
+from tests.common import assert_close, assert_equal, device
+
+
+def _mask_seqs(seqs: Tensor, padding_mask: Optional[PaddingMask]) -> Tensor:
+    if padding_mask is None:
+        return seqs
+
+    m = to_padding_mask(padding_mask.seq_lens, padding_mask.batch_seq_len)
+
+    return seqs * m.unsqueeze(-1).type_as(seqs)
+
+
+def _reference_forward(
+    m: Wav2Vec2PositionEncoder, seqs: Tensor, padding_mask: Optional[PaddingMask]
+) -> Tensor:
+    conv = m.conv
+
+    # The baseline implementation of the convolution.
+    ref_conv = Conv1d(
+        conv.in_channels,
+        conv.out_channels,
+        conv.kernel_size[0],
+        padding=conv.padding[0],
+        groups=conv.groups,
+        device=device,
+    )
+
+    ref_conv = weight_norm(ref_conv, dim=2)
+
+    with torch.no_grad():
+        ref_conv.weight_g.copy_(conv.weight_g)
+        ref_conv.weight_v.copy_(conv.weight_v)
+
+        assert ref_conv.bias is not None and conv.bias is not None
+
+        ref_conv.bias.copy_(conv.bias)
+
+    seqs = _mask_seqs(seqs, padding_mask)
+
+    encodings = ref_conv(seqs.transpose(1, 2))
+
+    if conv.kernel_size[0] % 2 == 0:
+        encodings = encodings[:, :, :-1]
+
+    encodings = gelu(encodings)
+
+    return seqs + encodings.transpose(1, 2)
+
+
+def _reference_stacked_forward(
+    m: Wav2Vec2StackedPositionEncoder,
+    seqs: Tensor,
+    padding_mask: Optional[PaddingMask],
+) -> Tensor:
+    seqs = _mask_seqs(seqs, padding_mask)
+
+    model_dim = seqs.size(-1)
+
+    encodings = seqs.transpose(1, 2)
+
+    for layer in m.layers:
+        encodings = conv1d(
+            encodings,
+            layer.conv.weight,
+            layer.conv.bias,
+            padding="same",
+            groups=layer.conv.groups,
+        )
+
+        encodings = layer_norm(encodings.transpose(1, 2), (model_dim,)).transpose(1, 2)
+
+        encodings = gelu(encodings)
+
+    return seqs + encodings.transpose(1, 2)
+
+
+@pytest.mark.parametrize("stacked", [False, True])
+@pytest.mark.parametrize("use_padding_mask", [False, True])
+def test_forward_does_not_modify_input(stacked: bool, use_padding_mask: bool) -> None:
+    m: Union[Wav2Vec2PositionEncoder, Wav2Vec2StackedPositionEncoder]
+
+    if stacked:
+        m = Wav2Vec2StackedPositionEncoder(32, 16, 4, 3, device=device)
+    else:
+        m = Wav2Vec2PositionEncoder(32, 16, 4, device=device)
+
+    if use_padding_mask:
+        seq_lens = torch.tensor([10, 7, 2], device=device)
+
+        padding_mask: Optional[PaddingMask] = PaddingMask(seq_lens, 10)
+    else:
+        padding_mask = None
+
+    seqs = torch.randn((3, 10, 32), device=device, requires_grad=True)
+
+    seqs_copy = seqs.detach().clone()
+
+    output = m(seqs, padding_mask)
+
+    grad_output = torch.randn_like(output)
+
+    output.backward(grad_output)
+
+    # The encodings must be accumulated into an intermediate, never into the
+    # input itself.
+    assert_equal(seqs.detach(), seqs_copy)
+
+    ref_seqs = seqs_copy.requires_grad_()
+
+    if stacked:
+        assert isinstance(m, Wav2Vec2StackedPositionEncoder)
+
+        expected = _reference_stacked_forward(m, ref_seqs, padding_mask)
+    else:
+        assert isinstance(m, Wav2Vec2PositionEncoder)
+
+        expected = _reference_forward(m, ref_seqs, padding_mask)
+
+    expected.backward(grad_output)
+
+    assert_close(output, expected)
+
+    assert seqs.grad is not None and ref_seqs.grad is not None
+
+    assert_close(seqs.grad, ref_seqs.grad)
+
+
+@pytest.mark.skipif(not is_pt2_or_greater(), reason="requires PyTorch 2.0.0 or greater")
+@pytest.mark.parametrize("stacked", [False, True])
+def test_compile_for_shape_works(stacked: bool) -> None:
+    m: Union[Wav2Vec2PositionEncoder, Wav2Vec2StackedPositionEncoder]
+
+    if stacked:
+        m = Wav2Vec2StackedPositionEncoder(32, 16, 4, 3, device=device)
+    else:
+        m = Wav2Vec2PositionEncoder(32, 16, 4, device=device)
+
+    m.eval()
+
+    seqs = torch.randn((2, 10, 32), device=device)
+
+    with torch.no_grad():
+        expected = m(seqs, None)
+
+        m.compile_for_shape(10)
+
+        assert_close(m(seqs, None), expected)
+
+        # A deep copy must run its own parameters.
+        m_copy = deepcopy(m)
+
+        for param in m_copy.parameters():
+            param.mul_(2.0)
+
+        assert m_copy.compiled_encode.seq_lens == {10}
+
+        expected_copy = m_copy(seqs, None)
+
+        # Run the copy eagerly for comparison.
+        m_copy.compiled_encode.seq_lens.clear()
+
+        assert_close(expected_copy, m_copy(seqs, None))
+
+
+class TestWav2Vec2PositionEncoder:
+    @pytest.mark.parametrize("kernel_size", [16, 15])
+    @pytest.mark.parametrize("use_padding_mask", [False, True])
+    def test_forward_matches_reference(
+        self, kernel_size: int, use_padding_mask: bool
+    ) -> None:
+        m = Wav2Vec2PositionEncoder(32, kernel_size, 4, device=device)
+
+        # Make sure that `g` and the bias are not trivially initialized.
+        with torch.no_grad():
+            m.conv.weight_g.uniform_(0.5, 1.5)
+
+            assert m.conv.bias is not None
+
+            m.conv.bias.normal_()
+
+        seqs = torch.randn((3, 10, 32), device=device)
+
+        if use_padding_mask:
+            seq_lens = torch.tensor([10, 7, 2], device=device)
+
+            padding_mask: Optional[PaddingMask] = PaddingMask(seq_lens, 10)
+        else:
+            padding_mask = None
+
+        expected = _reference_forward(m, seqs, padding_mask)
+
+        assert_close(m(seqs, padding_mask), expected)
+
+        m.eval()
+
+        with torch.no_grad():
+            assert_close(m(seqs, padding_mask), expected.detach())
+
+    def test_forward_works_if_encodings_are_not_channels_last(self) -> None:
+        m = Wav2Vec2PositionEncoder(32, 16, 4, device=device)
+
+        # With a non-zero padding mode, the convolution returns a contiguous
+        # (N, E, S) output; the encodings then cannot be accumulated into and
+        # the masked input is used instead.
+        m.conv.padding_mode = "reflect"
+
+        seq_lens = torch.tensor([10, 7, 2], device=device)
+
+        padding_mask = PaddingMask(seq_lens, 10)
+
+        seqs = torch.randn((3, 10, 32), device=device, requires_grad=True)
+
+        seqs_copy = seqs.detach().clone()
+
+        output = m(seqs, padding_mask)
+
+        grad_output = torch.randn_like(output)
+
+        output.backward(grad_output)
+
+        assert_equal(seqs.detach(), seqs_copy)
+
+        ref_seqs = seqs_copy.requires_grad_()
+
+        masked_seqs = _mask_seqs(ref_seqs, padding_mask)
+
+        expected = masked_seqs + m._encode(masked_seqs)
+
+        expected.backward(grad_output)
+
+        assert_close(output, expected)
+
+        assert seqs.grad is not None and ref_seqs.grad is not None
+
+        assert_close(seqs.grad, ref_seqs.grad)
+
+        with torch.no_grad():
+            assert_close(m(seqs, padding_mask), expected.detach())
+
+        assert_equal(seqs.detach(), seqs_copy)
+
+    def test_forward_calls_conv_module(self) -> None:
+        m = Wav2Vec2PositionEncoder(32, 16, 4, device=device)
+
+        outputs: List[Tensor] = []
+
+        m.conv.register_forward_hook(lambda _, __, output: outputs.append(output))
+
+        seqs = torch.randn((2, 10, 32), device=device)
+
+        m(seqs, None)
+
+        assert len(outputs) == 1
+
+    def test_forward_caches_weight_in_inference(self) -> None:
+        m = Wav2Vec2PositionEncoder(32, 16, 4, device=device)
+
+        # Must match the order of `torch.nn.utils.weight_norm`.
+        names = [name for name, _ in m.conv.named_parameters()]
+
+        assert names == ["bias", "weight_g", "weight_v"]
+
+        assert_close(m.conv.weight, m.conv.get_weight())
+
+        seqs = torch.randn((2, 10, 32), device=device)
+
+        expected = m(seqs, None)
+
+        m.eval()
+
+        with torch.no_grad():
+            output1 = m(seqs, None)
+
+            assert m.conv.cached_weight is not None
+
+            output2 = m(seqs, None)
+
+        assert_close(output1, expected.detach())
+        assert_close(output2, expected.detach())
+
+        m.train()
+
+        assert m.conv.cached_weight is None
+
+    def test_forward_caches_norm_if_direction_is_frozen(self) -> None:
+        m = Wav2Vec2PositionEncoder(32, 16, 4, device=device)
+
+        seqs = torch.randn((2, 10, 32), device=device)
+
+        expected = m(seqs, None)
+
+        m.conv.weight_v.requires_grad_(False)
+
+        output = m(seqs, None)
+
+        assert m.conv.cached_weight is None
+        assert m.conv.cached_v_norm is not None
+
+        assert_close(output, expected)
+
+        output.sum().backward()
+
+        assert m.conv.weight_g.grad is not None
+
+        v_norm = m.conv.cached_v_norm
+
+        optimizer = torch.optim.SGD([m.conv.weight_g], lr=0.1)
+
+        optimizer.step()
+
+        # Updating `g` must not invalidate the cached norm of `v`.
+        output = m(seqs, None)
+
+        assert m.conv.cached_v_norm is v_norm
+
+        assert_close(output, _reference_forward(m, seqs, None))
+
+        # Modifying `v` in-place must invalidate the cached norm.
+        expected = _reference_forward(m, seqs, None)
+
+        with torch.no_grad():
+            m.conv.weight_v.mul_(2.0)
+
+        assert_close(m(seqs, None), expected)
+
+        assert m.conv.cached_v_norm is not v_norm
+
+
+class TestWav2Vec2PositionalConv1d:
+    @pytest.mark.parametrize(
+        "stride,padding,dilation,padding_mode",
+        [
+            (1, "same", 1, "zeros"),
+            (2, 3, 1, "zeros"),
+            (1, 3, 2, "zeros"),
+            (1, 4, 1, "reflect"),
+        ],
+    )
+    def test_forward_matches_conv1d(
+        self, stride: int, padding: Union[str, int], dilation: int, padding_mode: str
+    ) -> None:
+        m = Wav2Vec2PositionalConv1d(
+            32,
+            32,
+            8,
+            stride=stride,
+            padding=padding,
+            dilation=dilation,
+            groups=4,
+            padding_mode=padding_mode,
+            device=device,
+        )
+
+        ref = Conv1d(
+            32,
+            32,
+            8,
+            stride=stride,
+            padding=padding,
+            dilation=dilation,
+            groups=4,
+            padding_mode=padding_mode,
+            device=device,
+        )
+
+        with torch.no_grad():
+            ref.weight.copy_(m.weight)
+
+            assert ref.bias is not None
+
+            ref.bias.copy_(m.bias)
+
+        # Pass a channels-last input as the position encoder does.
+        seqs = torch.randn((2, 20, 32), device=device).transpose(1, 2)
+
+        assert_close(m(seqs), ref(seqs))
+
+
+class TestWav2Vec2StackedPositionEncoder:
+    # Each layer uses a kernel size of 5 and 4 respectively.
+    @pytest.mark.parametrize("num_layers", [3, 4])
+    @pytest.mark.parametrize("dtype", [torch.float32, torch.bfloat16, torch.float16])
+    def test_forward_matches_reference(
+        self, num_layers: int, dtype: torch.dtype
+    ) -> None:
+        if dtype == torch.float16 and device.type == "cpu":
+            pytest.skip(reason="float16 convolutions require a CUDA device")
+
+        m = Wav2Vec2StackedPositionEncoder(
+            32, 16, 4, num_layers, device=device, dtype=dtype
+        )
+
+        # Large activations overflow the variance if it is not computed in
+        # single precision.
+        seqs = torch.randn((2, 10, 32), device=device, dtype=dtype) * 300.0
+
+        expected = _reference_stacked_forward(m, seqs, None)
+
+        output = m(seqs, None)
+
+        assert output.dtype == dtype
+
+        if dtype == torch.float32:
+            assert_close(output, expected)
+        else:
+            torch.testing.assert_close(output, expected, rtol=2e-2, atol=1e-1)
@@ -0,0 +1,67 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+from typing import Union
+
+import pytest
+import torch
+from torch.nn import Conv1d
+
+from fairseq2.nn import ChannelsLastConv1d
+from tests.common import assert_close, device
+
+
+class TestChannelsLastConv1d:
+    @pytest.mark.parametrize(
+        "stride,padding,dilation,padding_mode",
+        [
+            (1, "same", 1, "zeros"),
+            (2, 3, 1, "zeros"),
+            (1, 3, 2, "zeros"),
+            (1, 4, 1, "reflect"),
+        ],
+    )
+    def test_forward_matches_conv1d(
+        self, stride: int, padding: Union[str, int], dilation: int, padding_mode: str
+    ) -> None:
+        m = ChannelsLastConv1d(
+            32,
+            16,
+            8,
+            stride=stride,
+            padding=padding,
+            dilation=dilation,
+            groups=4,
+            padding_mode=padding_mode,
+            device=device,
+        )
+
+        ref = Conv1d(
+            32,
+            16,
+            8,
+            stride=stride,
+            padding=padding,
+            dilation=dilation,
+            groups=4,
+            padding_mode=padding_mode,
+            device=device,
+        )
+
+        ref.load_state_dict(m.state_dict())
+
+        seqs = torch.randn((2, 20, 32), device=device).transpose(1, 2)
+
+        assert_close(m(seqs), ref(seqs))
+
+    def test_forward_can_be_scripted(self) -> None:
+        m = ChannelsLastConv1d(32, 16, 3, padding=1, device=device)
+
+        seqs = torch.randn((2, 20, 32), device=device).transpose(1, 2)
+
+        scripted_m = torch.jit.script(m)
+
+        assert_close(scripted_m(seqs), m(seqs))
@@ -0,0 +1,81 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+from typing import Any, List
+
+import pytest
+import torch
+from torch import Tensor
+
+from fairseq2.nn.utils.compile import SeqLenSpecializedFunction
+from fairseq2.utils.version import is_pt2_or_greater
+from tests.common import assert_close, device
+
+
+def _fn(x: Tensor) -> Tensor:
+    return torch.nn.functional.gelu(x) * 2.0
+
+
+@pytest.mark.skipif(not is_pt2_or_greater(), reason="requires PyTorch 2.0.0 or greater")
+class TestSeqLenSpecializedFunction:
+    def test_call_dispatches_on_seq_len(self) -> None:
+        f = SeqLenSpecializedFunction(_fn, seq_dim=1)
+
+        f.add_seq_len(8)
+
+        calls: List[Tensor] = []
+
+        def compiled_fn(x: Tensor, *args: Any) -> Tensor:
+            calls.append(x)
+
+            return _fn(x)
+
+        f.compiled_fn = compiled_fn
+
+        # A registered length must be dispatched to the compiled function.
+        x = torch.randn((2, 8, 4), device=device)
+
+        assert f.is_compiled_for(x)
+
+        assert_close(f(x), _fn(x))
+
+        assert len(calls) == 1
+
+        # An unregistered length must run eagerly.
+        x = torch.randn((2, 6, 4), device=device)
+
+        assert not f.is_compiled_for(x)
+
+        assert_close(f(x), _fn(x))
+
+        assert len(calls) == 1
+
+    def test_call_runs_eagerly_if_no_seq_len_is_registered(self) -> None:
+        f = SeqLenSpecializedFunction(_fn, seq_dim=1)
+
+        x = torch.randn((2, 8, 4), device=device)
+
+        assert_close(f(x), _fn(x))
+
+        assert f.compiled_fn is None
+
+    def test_add_seq_len_raises_error_when_seq_len_is_invalid(self) -> None:
+        f = SeqLenSpecializedFunction(_fn, seq_dim=1)
+
+        with pytest.raises(
+            ValueError,
+            match=r"^`seq_len` must be greater than or equal to 1, but is 0 instead\.$",
+        ):
+            f.add_seq_len(0)
+
+    def test_call_matches_eager(self) -> None:
+        f = SeqLenSpecializedFunction(_fn, seq_dim=1)
+
+        f.add_seq_len(8)
+
+        x = torch.randn((2, 8, 4), device=device)
+
+        assert_close(f(x), _fn(x))